@@ -15,8 +15,11 @@
 import os, sys
 import re
 import argparse
+import io
 import zipfile
-from collections import OrderedDict
+import mmap
+
+import numpy as np
 
 # While testing:
 from pprint import pprint
@@ -26,26 +29,55 @@ from pprint import pprint
 # where censuscode is a 7-char string like P000001 or H016H018.
 CensusCodes = {}
 
+# Reverse index of CensusCodes: { 'censuscode': fileno },
+# giving the first file each code appears in.
+_CODE_TO_FILE = {}
+
+# Every code in CensusCodes as (pcode, desc, lowercased desc),
+# for searching descriptions without re-lowercasing them each time.
+_DESC_LOWER = []
+
 # Fields in the sf1geo file
 GeoFields = {}
 
+# GeoFields as a list of (code, start, end), in order,
+# for slicing up each line of a geo file.
+_GEO_SLICES = []
+
+# Patterns for parsing the .sas files, compiled once since they're
+# matched against every line.
+# The description stops at the first quote that isn't a doubled ''
+# (SAS's escaped quote), rather than using .* and backtracking
+# from the end of the line to find the last quote.
+_PAT_CODE = re.compile(b" *([A-Z][0-9]{3}[0-9A-Z]{3,4})=' *([^']*(?:''[^']*)*)'")
+# sf1geo.sas has two kinds of lines, labels and field positions,
+# so match both with one pattern and check which groups matched.
+_PAT_GEO_SAS = re.compile(rb"(?:LABEL )?(?P<lcode>[A-Z0-9]*)='(?P<lname>.*)'"
+                          rb"|(?P<fcode>[A-Z0-9]+) \$ (?P<fstart>[0-9]+)-(?P<fend>[0-9]+)")
+
 def codesFromZipFile(zipfilename):
     zf = zipfile.ZipFile(zipfilename, 'r')
-    pat = re.compile(b" *([A-Z][0-9]{3}[0-9A-Z]{3,4})=' *(.*)'")
+
+    # Many descriptions recur from file to file ("Total", "Male" ...):
+    # decode each distinct one once, so they all share one str.
+    # The pool only lives as long as this load.
+    decoded = {}
+
     for name in zf.namelist():
         if not name.lower().endswith('.sas'):
             continue
 
         # The sf1geo file is special, so parse it separately
         if name == 'sf1geo.sas':
-            parse_geo_sas_lines(zf.read(name).split(b'\n'))
+            with zf.open(name) as raw:
+                parse_geo_sas_lines(io.BufferedReader(raw, 1<<16))
             continue
 
         filematch = re.match('sf([0-9]{3}).sas', name.lower())
         if not filematch:
             # print(name, "doesn't match filematch pattern")
             continue
-        code_dict = OrderedDict()
+        code_dict = {}
         fileno = int(filematch.group(1))
 
         # basename = os.path.basename(name)
@@ -58,97 +90,156 @@ def codesFromZipFile(zipfilename):
         code_dict['CIFSN'] = 'Characteristic Iteration File Sequence Number'
         code_dict['LOGRECNO'] = 'Logical Record Number'
 
-        saslines = zf.read(name).split(b'\n')
-        for line in saslines:
-            m = re.match(pat, line)
-            if m:
-                pcode, desc = [ s.decode() for s in m.groups() ]
-                # print("%7s -- %s" % (code, desc))
-                code_dict[pcode] = desc
-            # else:
-            #     print("No match on line:", line)
+        # Stream the lines rather than reading the whole member into memory.
+        with zf.open(name) as raw:
+            for line in io.BufferedReader(raw, 1<<16):
+                m = _PAT_CODE.match(line)
+                if m:
+                    pcode, descbytes = m.groups()
+                    pcode = pcode.decode()
+                    desc = decoded.get(descbytes)
+                    if desc is None:
+                        desc = decoded[descbytes] = descbytes.decode()
+                    # print("%7s -- %s" % (code, desc))
+                    code_dict[pcode] = desc
+                # else:
+                #     print("No match on line:", line)
 
         CensusCodes[fileno] = code_dict
 
+    # Rebuild the indexes from scratch, since loading a file again
+    # replaces its entry in CensusCodes.
+    _CODE_TO_FILE.clear()
+    _DESC_LOWER[:] = []
+    for fileno, code_dict in CensusCodes.items():
+        for pcode, desc in code_dict.items():
+            _CODE_TO_FILE.setdefault(pcode, fileno)
+            _DESC_LOWER.append((pcode, desc, desc.lower()))
+
 
 def parse_geo_sas_lines(lines):
-    """lines are read from the sf1geo.sas file.
+    """lines are read from the sf1geo.sas file (any iterable of bytes).
        Create a dictionary of fields:
        { 'CODE': { 'name':'long name', 'start': int, 'end': int }
        { 'name', 'code', 'start', 'end' }
     """
-    labelpat = re.compile(b"(LABEL )?([A-Z0-9]*)\=\'(.*)\'")
-    fieldspat = re.compile(b"([A-Z0-9]+) \$ ([0-9]+)\-([0-9]+)")
     for line in lines:
         line = line.strip()
-        m = re.match(labelpat, line)
-        if m:
-            sys.stdout.flush()
+        m = _PAT_GEO_SAS.match(line)
+        if not m:
+            continue
+
+        if m.group('lname') is not None:
             # Assume here that labelpats all come before fieldspats,
             # so if we're seeing a labelpat, it doesn't already exist
             # inside GeoFields.
-            code = m.group(2).decode()
-            GeoFields[code] = { 'name': m.group(3).decode() }
-            continue
-
-        m = re.match(fieldspat, line)
-        if m:
+            code = m.group('lcode').decode()
+            GeoFields[code] = { 'name': m.group('lname').decode() }
+        else:
             # If there's a fieldspat for this code, it should have
             # had a long description already using a labelpat,
-            # so the code (group(1)) should already be in GeoFields.
-            # print("groups:", m.groups())
-            code = m.group(1).decode()
-            GeoFields[code]['start'] = int(m.group(2)) - 1
-            GeoFields[code]['end']   = int(m.group(3))
-            continue
+            # so the code should already be in GeoFields.
+            code = m.group('fcode').decode()
+            GeoFields[code]['start'] = int(m.group('fstart')) - 1
+            GeoFields[code]['end']   = int(m.group('fend'))
 
     # pprint(GeoFields)
 
+    _GEO_SLICES[:] = []
+    for code, field in GeoFields.items():
+        try:
+            _GEO_SLICES.append((code, field['start'], field['end']))
+        except KeyError:
+            print("Key error, GeoFields[%s] =" % code, field)
+            break
 
-def file_for_code(code):
-    for fileno in CensusCodes:
-        if code in CensusCodes[fileno]:
-            return fileno
 
-    return None
+def file_for_code(code):
+    return _CODE_TO_FILE.get(code)
 
 
 def codes_for_description(desc):
-    codes = []
     desc = desc.lower()
-    for fileno in CensusCodes:
-        for pcode in CensusCodes[fileno]:
-            if desc in CensusCodes[fileno][pcode].lower():
-                codes.append((pcode, CensusCodes[fileno][pcode]))
-    return codes
+    return [ (pcode, d) for pcode, d, dlower in _DESC_LOWER
+             if desc in dlower ]
 
 
 counties = []
 
 def parse_geo_file(filename):
-    with open(filename) as fp:
-        for line in fp:
-            geo = parse_geo_line(line)
-            c = geo['COUNTY'].strip()
-            if c:
-                c = int(c)
-                if c not in counties:
-                    counties.append(c)
-
-    counties.sort()
+    county_set = set(counties)
+    # The geo files can be hundreds of megabytes: read them as bytes
+    # (fields are plain ASCII, so there's no need to decode) with a
+    # buffer much bigger than the default.
+    with open(filename, 'rb', buffering=262144) as fp:
+        records = geo_file_records(fp)
+        if records is not None:
+            # Only the distinct values need to be stripped and converted.
+            for c in np.unique(geo_column(records, 'COUNTY')):
+                c = c.strip()
+                if c:
+                    county_set.add(int(c))
+        else:
+            # Only COUNTY is needed, so don't build a whole
+            # parse_geo_line() dict for every line.
+            start = GeoFields['COUNTY']['start']
+            end = GeoFields['COUNTY']['end']
+            for line in fp:
+                c = line[start:end].strip()
+                if c:
+                    county_set.add(int(c))
+
+    counties[:] = sorted(county_set)
     print("Counties:", counties)
 
 
+def geo_file_records(fp):
+    """Memory-map an open <st>geo.uf1 file as a 2-D numpy array of bytes,
+       one row per record, so fields can be pulled out as whole columns
+       with geo_column() instead of slicing each line.
+       Records are fixed width; if the file doesn't look that way,
+       return None and the caller should go line by line instead.
+    """
+    size = os.fstat(fp.fileno()).st_size
+    if not size:
+        return None
+    mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    reclen = mm.find(b'\n') + 1
+    if reclen <= 0 or size % reclen:
+        mm.close()
+        return None
+
+    # Every record has to end in a newline, with no others inside it,
+    # or short lines could be merged together into one record.
+    # Check a block of records at a time, so the comparison doesn't
+    # need a temporary array as big as the whole file.
+    records = np.frombuffer(mm, dtype=np.uint8).reshape(-1, reclen)
+    blockrows = max(1, (1<<20) // reclen)
+    for i in range(0, len(records), blockrows):
+        block = records[i:i+blockrows]
+        if np.count_nonzero(block == ord('\n')) != len(block) or \
+           (block[:, -1] != ord('\n')).any():
+            del block, records
+            mm.close()
+            return None
+    return records
+
+
+def geo_column(records, code):
+    """Given records from geo_file_records(), return the field
+       GeoFields[code] for every record, as a numpy array of bytes.
+    """
+    start = GeoFields[code]['start']
+    end = GeoFields[code]['end']
+    column = np.ascontiguousarray(records[:, start:end])
+    return column.view('S%d' % (end - start)).ravel()
+
+
 def parse_geo_line(line):
-    """Parse the <st>geo.uf1 file according to the GeoFields.
+    """Parse a line of the <st>geo.uf1 file according to the GeoFields.
+       line may be str or bytes; the fields will be the same type.
     """
-    d = {}
-    for code in GeoFields:
-        try:
-            d[code] = line[GeoFields[code]['start']:GeoFields[code]['end']]
-        except KeyError:
-            print("Key error, GeoFields[%s] =" % code, GeoFields[code])
-            break
+    d = { code: line[start:end] for code, start, end in _GEO_SLICES }
 
     # print("Line:", line)
     # for field in d:
@@ -1,11 +1,10 @@
-#!/usr/bin/env python
-
-from __future__ import print_function
+#!/usr/bin/env python3
 
 import curses
-import time
 import sys
 
+import numpy as np
+
 errstr = ''
 
 numwidth = 5
@@ -41,55 +40,78 @@ width -= numwidth+1
 height -= 1
 
 # How many numbers will fit on a line, or on the whole screen?
-numsperline = int(width / numwidth)
+numsperline = width // numwidth
 maxnum = numsperline * height
 
-attributes = [0] * (maxnum+2)
+attributes = np.zeros(maxnum+2, dtype=np.int32)
+
+# Set DEBUG to True to log progress to /tmp/sieve.log.
+# The log is block buffered, not line buffered, so it won't slow
+# things down with a write for every line.
+DEBUG = False
+if DEBUG:
+    logf = open("/tmp/sieve.log", "w")
+    print("Maxnum is", maxnum, file=logf)
+else:
+    logf = None
 
-logf = open("/tmp/sieve.log", "w", buffering=1)
-print("Maxnum is", maxnum, file=logf)
+# The attributes currently shown on screen, so redraw_screen()
+# only has to touch cells that changed since the last redraw.
+drawn_attributes = None
+
+def set_cell_attr(num, attr):
+    y, col = divmod(num-1, numsperline)
+    stdscr.chgat(y, col * numwidth, numwidth, attr)
 
 def redraw_screen(highlight=None):
-    num = 0
-    while True:
-        num += 1
-        x = ((num-1) % numsperline) * numwidth
-        y = int ((num-1) / numsperline)
-        if y >= height:
-            return
-
-        if x < numwidth:
-            print(".\n", file=logf)
-        print("'%s' @ (%d, %d) " % (fmt % num, x, y), end=' ', file=logf)
-        #errstr += "'%s' @ (%d, %d) " % (fmt % num, x, y)
-        #errstr += "\nstdscr.addstr(%d, %d, '%s')" % (y, x, fmt % num)
-        if highlight == num:
-            stdscr.addstr(y, x, fmt % num, highlightpair)
-        else:
-            stdscr.addstr(y, x, fmt % num, attributes[num])
+    global drawn_attributes
+
+    if drawn_attributes is None:
+        # First time: write out all the numbers, a row at a time.
+        for y in range(height):
+            first = y * numsperline + 1
+            rownums = range(first, first + numsperline)
+            stdscr.addstr(y, 0, ''.join(fmt % num for num in rownums))
+        drawn_attributes = np.zeros_like(attributes)
+
+    changed = np.flatnonzero(attributes[1:maxnum+1]
+                             != drawn_attributes[1:maxnum+1]) + 1
+    for num in changed:
+        set_cell_attr(num, int(attributes[num]))
+    if logf:
+        print("Redrew", len(changed), "cells", file=logf)
+    drawn_attributes[:] = attributes
+
+    # Record the highlight as drawn, so it gets un-highlighted
+    # the next time through.
+    if highlight and highlight <= maxnum:
+        set_cell_attr(highlight, highlightpair)
+        drawn_attributes[highlight] = highlightpair
 
     stdscr.refresh()
-    print("Refreshed", file=logf)
-    return num
+    if logf:
+        print("Refreshed", file=logf)
+
+def sieve_step(attr, start, mark, limit):
+    """Find the first prime after start, mark its multiples below limit
+       in attr with mark, and return the prime.
+    """
+    # Skip past known composites to the next prime:
+    unmarked = np.flatnonzero(attr[start+1:] == 0)
+    prime = start + int(unmarked[0]) + 1
+
+    # Mark every multiple of it as composite.
+    attr[2*prime:limit:prime] = mark
+    return prime
 
 try:
     key = None
     divisor = 1
 
     while key != ord('q'):
-        # Skip past known composites to the next prime:
-        divisor += 1
-        while attributes[divisor]:
-            divisor += 1
-            print("divisor++ to", divisor, file=logf)
-        print(divisor, "is prime", file=logf)
-
-        for i in range(1, maxnum):
-            if i > divisor and i % divisor == 0:
-                print("Setting attribute for", i, file=logf)
-                attributes[i] = colorpair
-
-        print("Finished setting attributes for", divisor, file=logf)
+        divisor = sieve_step(attributes, divisor, colorpair, maxnum)
+        if logf:
+            print(divisor, "is prime", file=logf)
 
         redraw_screen(highlight=divisor)
         key = stdscr.getch()
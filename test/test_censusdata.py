@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Tests for censusdata.py
+
+import unittest
+
+import shutil
+import os
+import zipfile
+
+import censusdata
+
+TMPDIR = '/tmp/test-censusdata'
+
+GEO_SAS = b"""DATA SF1GEO;
+LABEL FILEID='File Identification'
+STUSAB='State/US-Abbreviation (USPS)'
+COUNTY='County'
+TRACT='Census Tract'
+INPUT
+FILEID $ 1-6
+STUSAB $ 7-8
+COUNTY $ 9-11
+TRACT $ 12-17
+;
+"""
+
+SF001_SAS = b"""DATA SF1;
+  P001001='Total population'
+  P002001=' Urban and rural: Total'
+  P002002='Urban'
+  P002003='Rural: total rural total'
+"""
+
+# The real Census .sas files have DOS line endings.
+SF003_SAS = b"""DATA SF3;\r
+  P004001='Hispanic or Latino: Total'\r
+  P004002='Not Hispanic or Latino'\r
+"""
+
+SF002_SAS = b"""  P003001='Race: Total'
+  H001001='Housing units Total'
+  H001002='A\xc3\x91O ESTRUCTURA CONSTRUIDA'
+  H002001='Householder''s age'  /* 'note' */
+"""
+
+class TestCensusData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if os.path.exists(TMPDIR):
+            shutil.rmtree(TMPDIR)
+        os.mkdir(TMPDIR)
+
+        cls.zipfilename = os.path.join(TMPDIR, "SF1SAS.zip")
+        with zipfile.ZipFile(cls.zipfilename, 'w') as zf:
+            zf.writestr('sf1geo.sas', GEO_SAS.replace(b'\n', b'\r\n'))
+            zf.writestr('sf001.sas', SF001_SAS)
+            zf.writestr('sf002.sas', SF002_SAS)
+            zf.writestr('sf003.sas', SF003_SAS)
+
+        censusdata.codesFromZipFile(cls.zipfilename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TMPDIR)
+
+    @staticmethod
+    def slow_codes_for_description(desc):
+        """The straightforward search that codes_for_description
+           has to agree with.
+        """
+        desc = desc.lower()
+        codes = []
+        for fileno in censusdata.CensusCodes:
+            for pcode, d in censusdata.CensusCodes[fileno].items():
+                if desc in d.lower():
+                    codes.append((pcode, d))
+        return codes
+
+    def test_codes_for_description(self):
+        self.assertEqual(censusdata.codes_for_description("urban"),
+                         [('P002001', 'Urban and rural: Total'),
+                          ('P002002', 'Urban')])
+
+        # Case folding isn't limited to ASCII.
+        self.assertEqual(censusdata.codes_for_description("año"),
+                         [('H001002', 'AÑO ESTRUCTURA CONSTRUIDA')])
+
+        # A description that contains the needle more than once
+        # should still only be reported once.
+        for desc in [ "total", "TOTAL", "file identification",
+                      "logical record number", "housing units total",
+                      "l", "r: t", "", "nothing like this" ]:
+            self.assertEqual(censusdata.codes_for_description(desc),
+                             TestCensusData.slow_codes_for_description(desc))
+
+
+    def test_crlf_sas(self):
+        self.assertEqual(list(censusdata.CensusCodes[3].items())[5:],
+                         [('P004001', 'Hispanic or Latino: Total'),
+                          ('P004002', 'Not Hispanic or Latino')])
+        self.assertEqual(censusdata.GeoFields['COUNTY'],
+                         { 'name': 'County', 'start': 8, 'end': 11 })
+        self.assertEqual(censusdata.GeoFields['TRACT'],
+                         { 'name': 'Census Tract', 'start': 11, 'end': 17 })
+
+    def test_doubled_quotes(self):
+        # SAS escapes a quote inside a string by doubling it.
+        self.assertEqual(censusdata.CensusCodes[2]['H002001'],
+                         "Householder''s age")
+
+        m = censusdata._PAT_CODE.match(b"  P001002='It''s ''quoted'''")
+        self.assertEqual(m.groups(), (b'P001002', b"It''s ''quoted''"))
+        self.assertIsNone(censusdata._PAT_CODE.match(b' ' * 1000))
+
+    def test_file_for_code(self):
+        self.assertEqual(censusdata.file_for_code('P001001'), 1)
+        self.assertEqual(censusdata.file_for_code('H001001'), 2)
+        # Codes in every file are found in the first one.
+        self.assertEqual(censusdata.file_for_code('FILEID'), 1)
+        self.assertEqual(censusdata.file_for_code('NOSUCH'), None)
+
+    def test_reload(self):
+        # Loading the same zip again shouldn't duplicate anything
+        # in the indexes.
+        before = censusdata.codes_for_description("total")
+        censusdata.codesFromZipFile(self.zipfilename)
+        self.assertEqual(censusdata.codes_for_description("total"), before)
+        self.assertEqual(censusdata.file_for_code('H001001'), 2)
+
+    def parse_counties(self, contents):
+        geofile = os.path.join(TMPDIR, "nmgeo.uf1")
+        with open(geofile, 'wb') as fp:
+            fp.write(contents)
+        censusdata.counties[:] = []
+        censusdata.parse_geo_file(geofile)
+        return censusdata.counties
+
+    def test_geo_file(self):
+        # Counties should come out once each, sorted, skipping blanks.
+        lines = [ b'uSF1  NM%s123456\n' % c
+                  for c in [ b'028', b'003', b'001', b'   ', b'003' ] ]
+        self.assertEqual(self.parse_counties(b''.join(lines)), [1, 3, 28])
+        self.assertEqual(self.parse_counties(b''), [])
+
+    def test_geo_file_line_by_line(self):
+        # Records that aren't all the same length can't be mmapped
+        # as fixed width, and have to be read line by line.
+        lines = [ b'uSF1  NM001123456\n', b'uSF1  NM003123456   \n',
+                  b'uSF1  NM   123456\n', b'uSF1  NM00\n' ]
+        self.assertEqual(self.parse_counties(b''.join(lines)), [0, 1, 3])
+
+    def test_parse_geo_line(self):
+        self.assertEqual(censusdata.parse_geo_line(b'uSF1  NM001123456\n'),
+                         { 'FILEID': b'uSF1  ', 'STUSAB': b'NM',
+                           'COUNTY': b'001', 'TRACT': b'123456' })
+        self.assertEqual(censusdata.parse_geo_line('uSF1  NM001123456'),
+                         { 'FILEID': 'uSF1  ', 'STUSAB': 'NM',
+                           'COUNTY': '001', 'TRACT': '123456' })
+
+    def test_geo_file_records(self):
+        recfile = os.path.join(TMPDIR, "records")
+        for contents, shape in [ (b'abc\nabd\n', (2, 4)),
+                                 (b'abc\nabc\nab\n\n', None),
+                                 (b'abc\nabcd\n', None),
+                                 (b'abc', None),
+                                 (b'', None),
+                                 # Enough records for several blocks:
+                                 (b'abc\n' * 600000, (600000, 4)),
+                                 (b'abc\n' * 599999 + b'ab\n\n', None) ]:
+            with open(recfile, 'wb') as fp:
+                fp.write(contents)
+            with open(recfile, 'rb') as fp:
+                records = censusdata.geo_file_records(fp)
+                if shape:
+                    self.assertEqual(records.shape, shape)
+                else:
+                    self.assertIsNone(records)
+                del records
+
+
+if __name__ == '__main__':
+    unittest.main()